@@ -3,7 +3,19 @@ import os
 import time
 import re
 import json
-from typing import Dict, Optional
+import gzip
+import zlib
+import functools
+import heapq
+import itertools
+import random
+import argparse
+import contextlib
+import socket
+import sqlite3
+import tempfile
+import multiprocessing
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from tqdm import tqdm
 import tkinter as tk
 from tkinter import ttk, messagebox
@@ -13,6 +25,58 @@ import platform
 from datetime import datetime
 import webbrowser  # 添加导入
 
+try:
+    import zstandard  # 可选：元数据导出的 zstd 压缩
+except ImportError:
+    zstandard = None
+
+def create_session(max_retries: int = 3, pool_size: int = 10) -> requests.Session:
+    """
+    /**
+     * 创建带重试的 HTTP 会话，可在多个爬虫和下载器之间共享连接池
+     * @param {int} max_retries - 最大重试次数
+     * @param {int} pool_size - 连接池大小
+     * @returns {requests.Session} 会话
+     */
+    """
+    session = requests.Session()
+    retry = requests.adapters.Retry(
+        total=max_retries,
+        backoff_factor=0.5,
+        status_forcelist=[500, 502, 503, 504]
+    )
+    session.mount('https://', requests.adapters.HTTPAdapter(
+        max_retries=retry,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size
+    ))
+    return session
+
+class RateLimiter:
+    """
+    /**
+     * 请求限速器，可在多个线程和用户之间共享
+     * @param {float} min_interval - 两次请求之间的最小间隔秒数
+     */
+    """
+    def __init__(self, min_interval: float = 1.0):
+        self.min_interval = min_interval
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        /**
+         * 阻塞直到允许发出下一次请求
+         */
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
 class MysPostCrawler:
     """
     /**
@@ -21,15 +85,25 @@ class MysPostCrawler:
      * @param {string} base_path - 图片保存基础路径
      */
     """
-    def __init__(self, uid: str, base_path: str):
+    def __init__(self, uid: str, base_path: str, scheduler: Optional["DownloadScheduler"] = None,
+                 session: Optional[requests.Session] = None, rate_limiter: Optional[RateLimiter] = None,
+                 metadata_sink: Optional["MetadataSink"] = None):
         """
         /**
          * 初始化爬虫
          * @param {string} uid - 用户ID
          * @param {string} base_path - 图片保存基础路径
+         * @param {DownloadScheduler} scheduler - 下载调度器，为空时按顺序同步下载
+         * @param {requests.Session} session - 共享的 HTTP 会话，为空时新建
+         * @param {RateLimiter} rate_limiter - 共享的接口请求限速器，为空时不限速
+         * @param {MetadataSink} metadata_sink - 帖子元数据导出器，为空时不导出
          */
         """
         self.uid = uid
+        self.scheduler = scheduler
+        self.session = session or create_session()
+        self.rate_limiter = rate_limiter
+        self.metadata_sink = metadata_sink
         self.base_url = "https://bbs-api.miyoushe.com/post/wapi/userPost"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
@@ -42,7 +116,12 @@ class MysPostCrawler:
         self.username = self.get_username()
         # 更新保存路径，加入用户名
         self.save_path = os.path.join(base_path, self.username)
-        self.downloader = ImageDownloader(base_path=self.save_path)
+        self.downloader = ImageDownloader(base_path=self.save_path, session=self.session)
+
+    def _get(self, params: Dict) -> requests.Response:
+        if self.rate_limiter:
+            self.rate_limiter.wait()
+        return self.session.get(self.base_url, headers=self.headers, params=params, timeout=30)
 
     def validate_uid(self) -> bool:
         """
@@ -57,7 +136,7 @@ class MysPostCrawler:
                 "size": 1,
                 "offset": ""
             }
-            response = requests.get(self.base_url, headers=self.headers, params=params)
+            response = self._get(params)
             data = response.json()
             
             # 检查响应数据
@@ -84,7 +163,7 @@ class MysPostCrawler:
                 "size": 1,
                 "offset": ""
             }
-            response = requests.get(self.base_url, headers=self.headers, params=params)
+            response = self._get(params)
             data = response.json()
             
             if data and "data" in data and "list" in data["data"] and data["data"]["list"]:
@@ -98,26 +177,23 @@ class MysPostCrawler:
         
         return self.uid
 
-    def fetch_page(self, offset: str = "") -> Optional[Dict]:
+    def fetch_page(self, offset: str = "", size: int = 20) -> Optional[Dict]:
         """
         /**
          * 获取单页帖子数据
          * @param {string} offset - 偏移量
+         * @param {int} size - 每页帖子数
          * @returns {Optional[Dict]} 帖子数据
          */
         """
         params = {
             "uid": self.uid,
-            "size": 20,
+            "size": size,
             "offset": offset
         }
         
         try:
-            response = requests.get(
-                self.base_url,
-                params=params,
-                headers=self.headers
-            )
+            response = self._get(params)
             data = response.json()
             
             if data["retcode"] != 0:
@@ -200,34 +276,105 @@ class MysPostCrawler:
                     break
                 
                 offset = data["data"]["next_offset"]
+                
+                # 调度队列积压过多时暂停翻页，等待下载追上
+                if self.scheduler:
+                    self.scheduler.wait_for_capacity()
                 time.sleep(1)
                 
+            if self.scheduler:
+                self.scheduler.join()
+                
         except KeyboardInterrupt:
+            if self.scheduler:
+                self.scheduler.cancel()
             print("\n用户中断下载")
             return
             
         final_size = self.downloader.get_size_str()
         print(f"\n\n下载完成！共处理 {total_count} 条帖子，总大小 {final_size}")
 
-    def process_single_post(self, post: Dict):
+    def iter_post_images(self, post: Dict) -> Iterator[Tuple[str, str, Optional[int]]]:
         """
         /**
-         * 处理单条帖子数据
+         * 遍历帖子中的图片
          * @param {Dict} post - 帖子数据
+         * @returns {Iterator} (图片URL, 文件名, 字节大小) 元组，大小未知时为 None
          */
         """
         if 'image_list' in post and post['image_list']:
             post_id = post['post']['post_id']
-            subject = post['post']['subject']
             
             for idx, img in enumerate(post['image_list']):
                 if 'url' in img:
-                    self.downloader.download_image(
-                        url=img['url'],
-                        subject=subject,
-                        filename=f"{post_id}_{idx}.{img['format'].lower()}"
-                    )
-                    time.sleep(0.5)
+                    try:
+                        size = int(img.get('size') or 0) or None
+                    except (TypeError, ValueError):
+                        size = None
+                    yield img['url'], f"{post_id}_{idx}.{img['format'].lower()}", size
+
+    def process_single_post(self, post: Dict, on_complete: Optional[Callable[[bool], None]] = None):
+        """
+        /**
+         * 处理单条帖子数据
+         * 设置了调度器时只提交下载任务，否则按顺序同步下载
+         * @param {Dict} post - 帖子数据
+         * @param {Callable} on_complete - 帖子的所有图片都结束后的回调，参数为是否全部下载成功
+         */
+        """
+        subject = post['post']['subject']
+        created_at = int(post['post'].get('created_at') or 0)
+        images = list(self.iter_post_images(post))
+        image_paths = {url: self.downloader.get_image_path(subject, filename) for url, filename, _ in images}
+        downloaded: Dict[str, bool] = {}
+        
+        if not self.scheduler:
+            for url, filename, size in images:
+                downloaded[url] = self.downloader.download_image(
+                    url=url,
+                    subject=subject,
+                    filename=filename
+                )
+                time.sleep(0.5)
+            self._finish_post(post, image_paths, downloaded, on_complete)
+            return
+        
+        if not images:
+            self._finish_post(post, image_paths, downloaded, on_complete)
+            return
+        
+        remaining = len(images)
+        lock = threading.Lock()
+        
+        def on_done(url: str, success: bool):
+            # 帖子的所有图片都结束（成功、失败或被取消）后再写入元数据
+            nonlocal remaining
+            with lock:
+                downloaded[url] = downloaded.get(url, False) or success
+                remaining -= 1
+                finished = remaining == 0
+            if finished:
+                self._finish_post(post, image_paths, downloaded, on_complete)
+        
+        track = self.metadata_sink is not None or on_complete is not None
+        for url, filename, size in images:
+            self.scheduler.submit(DownloadTask(
+                downloader=self.downloader,
+                url=url,
+                subject=subject,
+                filename=filename,
+                user=self.uid,
+                created_at=created_at,
+                size=size,
+                callback=functools.partial(on_done, url) if track else None
+            ))
+
+    def _finish_post(self, post: Dict, image_paths: Dict[str, str], downloaded: Dict[str, bool],
+                     on_complete: Optional[Callable[[bool], None]]):
+        if self.metadata_sink:
+            self.metadata_sink.write_post(post, image_paths, downloaded)
+        if on_complete:
+            on_complete(all(downloaded.values()))
 
 class ImageDownloader:
     """
@@ -235,33 +382,65 @@ class ImageDownloader:
      * 图片下载器
      * @param {string} base_path - 图片保存基础路径
      * @param {int} max_retries - 最大重试次数
+     * @param {requests.Session} session - 共享的 HTTP 会话，为空时新建
      */
     """
-    def __init__(self, base_path: str, max_retries: int = 3):
+    def __init__(self, base_path: str, max_retries: int = 3, session: Optional[requests.Session] = None):
         self.base_path = base_path
         self.max_retries = max_retries
         self.total_bytes = 0
+        self._lock = threading.Lock()
         self._create_base_dir()
-        self.session = requests.Session()
-        retry = requests.adapters.Retry(
-            total=max_retries,
-            backoff_factor=0.5,
-            status_forcelist=[500, 502, 503, 504]
-        )
-        self.session.mount('https://', requests.adapters.HTTPAdapter(max_retries=retry))
+        self.session = session or create_session(max_retries)
 
     def _create_base_dir(self) -> None:
-        if not os.path.exists(self.base_path):
-            os.makedirs(self.base_path)
+        os.makedirs(self.base_path, exist_ok=True)
 
     def _create_subject_dir(self, subject: str) -> str:
+        subject_path = self._get_subject_path(subject)
+        # 多个下载线程可能同时创建同一目录
+        os.makedirs(subject_path, exist_ok=True)
+        return subject_path
+
+    def _get_subject_path(self, subject: str) -> str:
         clean_subject = re.sub(r'[\\/:*?"<>|]', '_', subject)
         clean_subject = clean_subject[:50]
-        subject_path = os.path.join(self.base_path, clean_subject)
-        
-        if not os.path.exists(subject_path):
-            os.makedirs(subject_path)
-        return subject_path
+        return os.path.join(self.base_path, clean_subject)
+
+    def get_image_path(self, subject: str, filename: str) -> str:
+        """
+        /**
+         * 获取图片的本地保存路径（不创建目录）
+         * @param {string} subject - 帖子主题
+         * @param {string} filename - 文件名
+         * @returns {string} 本地文件路径
+         */
+        """
+        return os.path.join(self._get_subject_path(subject), filename)
+
+    def probe_size(self, url: str) -> Optional[int]:
+        """
+        /**
+         * 通过 HEAD 请求的 Content-Length 获取图片大小
+         * @param {string} url - 图片URL
+         * @returns {Optional[int]} 字节大小，未知时返回 None
+         */
+        """
+        try:
+            response = self.session.head(
+                url,
+                timeout=10,
+                allow_redirects=True,
+                headers={
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                }
+            )
+            length = response.headers.get('Content-Length')
+            if response.status_code == 200 and length:
+                return int(length)
+        except Exception:
+            pass
+        return None
 
     def get_size_str(self) -> str:
         """
@@ -286,7 +465,8 @@ class ImageDownloader:
          * @param {int} bytes_size - 文件字节大小
          */
         """
-        self.total_bytes += bytes_size
+        with self._lock:
+            self.total_bytes += bytes_size
 
     def download_image(self, url: str, subject: str, filename: str) -> bool:
         """
@@ -318,8 +498,7 @@ class ImageDownloader:
                 
                 if response.status_code == 200:
                     content = response.content
-                    with open(file_path, 'wb') as f:
-                        f.write(content)
+                    self._write_file(file_path, content)
                     self.add_size(len(content))
                     return True
                     
@@ -336,8 +515,7 @@ class ImageDownloader:
                     
                     if response.status_code == 200:
                         content = response.content
-                        with open(file_path, 'wb') as f:
-                            f.write(content)
+                        self._write_file(file_path, content)
                         self.add_size(len(content))
                         return True
                         
@@ -355,6 +533,22 @@ class ImageDownloader:
             
         return False
 
+    def _write_file(self, file_path: str, content: bytes):
+        # 先写入同目录下的临时文件再替换，进程中途被杀也不会留下不完整的图片被当作已下载
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(file_path),
+            prefix=os.path.basename(file_path) + ".",
+            suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
     def get_total_size(self) -> int:
         """
         /**
@@ -364,8 +558,1203 @@ class ImageDownloader:
         """
         return self.total_bytes
 
+class DownloadTask:
+    """
+    /**
+     * 图片下载任务
+     * @param {ImageDownloader} downloader - 执行下载的下载器
+     * @param {string} url - 图片URL
+     * @param {string} subject - 帖子主题
+     * @param {string} filename - 文件名
+     * @param {string} user - 所属用户ID，用于多用户间公平调度
+     * @param {int} created_at - 帖子发布时间戳
+     * @param {Optional[int]} size - 图片字节大小，未知时为 None
+     * @param {Callable} callback - 任务结束（成功、失败或被取消）时的回调，参数为是否下载成功
+     */
+    """
+    def __init__(self, downloader: ImageDownloader, url: str, subject: str, filename: str,
+                 user: str = "", created_at: int = 0, size: Optional[int] = None,
+                 callback: Optional[Callable[[bool], None]] = None):
+        self.downloader = downloader
+        self.url = url
+        self.subject = subject
+        self.filename = filename
+        self.user = user
+        self.created_at = created_at
+        self.size = size
+        self.callback = callback
+        self.cost = 0
+
+class DownloadScheduler:
+    """
+    /**
+     * 图片下载调度器
+     * 位于帖子发现与 ImageDownloader 之间：按优先级派发下载任务，
+     * 限制同时下载中的总字节数，并在积压过多时让翻页等待
+     * @param {int} max_workers - 下载线程数
+     * @param {int} max_bytes_in_flight - 同时下载中的总字节上限
+     * @param {int} max_queued_bytes - 等待队列的字节上限，超出后翻页需等待，默认同 max_bytes_in_flight
+     * @param {string} order - 用户内的优先顺序，"smallest" 小图优先，"newest" 新帖优先
+     * @param {boolean} probe_size - 大小未知时是否用 HEAD 请求探测 Content-Length
+     * @param {float} interval - 每个线程两次下载之间的间隔秒数
+     */
+    """
+    # 大小未知时用于占额的估计值
+    DEFAULT_SIZE_ESTIMATE = 2 * 1024 * 1024
+
+    def __init__(self, max_workers: int = 4, max_bytes_in_flight: int = 64 * 1024 * 1024,
+                 max_queued_bytes: Optional[int] = None, order: str = "smallest",
+                 probe_size: bool = True, interval: float = 0.5):
+        if order not in ("smallest", "newest"):
+            raise ValueError(f"不支持的调度顺序: {order}")
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.max_queued_bytes = max_queued_bytes or max_bytes_in_flight
+        self.order = order
+        self.probe_size = probe_size
+        self.interval = interval
+        
+        # 每个用户一个优先队列，用户之间按已派发字节数轮转
+        self._queues: Dict[str, List] = {}
+        self._served: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._queued_bytes = 0
+        self._inflight_bytes = 0
+        self._active = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        
+        self.completed = 0
+        self.failed = 0
+        
+        self._workers = []
+        for _ in range(max_workers):
+            worker = threading.Thread(target=self._worker_loop)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _priority(self, task: DownloadTask) -> Tuple:
+        if self.order == "newest":
+            return (-task.created_at, task.cost)
+        return (task.cost, -task.created_at)
+
+    def submit(self, task: DownloadTask):
+        """
+        /**
+         * 提交下载任务（不阻塞）
+         * @param {DownloadTask} task - 下载任务
+         */
+        """
+        file_path = task.downloader.get_image_path(task.subject, task.filename)
+        if os.path.exists(file_path):
+            # 已下载的文件直接计入大小，不进入队列，也不占用下载额度
+            task.downloader.add_size(os.path.getsize(file_path))
+            self._finish(task, True)
+            return
+        if task.size is None and self.probe_size:
+            task.size = task.downloader.probe_size(task.url)
+        task.cost = task.size if task.size else self.DEFAULT_SIZE_ESTIMATE
+        
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("下载调度器已关闭")
+            queue = self._queues.setdefault(task.user, [])
+            if not queue:
+                # 新加入或重新活跃的用户从当前最小进度开始，避免累积过多优先权
+                active = [self._served[u] for u, q in self._queues.items() if q]
+                self._served[task.user] = max(self._served.get(task.user, 0), min(active, default=0))
+            heapq.heappush(queue, (self._priority(task), next(self._seq), task))
+            self._queued_bytes += task.cost
+            self._cond.notify_all()
+
+    def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        """
+        /**
+         * 等待队列积压降到上限以下，供翻页循环实现背压
+         * @param {Optional[float]} timeout - 最长等待秒数，为空时一直等待
+         * @returns {boolean} 是否已有空余额度
+         */
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._closed or self._queued_bytes < self.max_queued_bytes,
+                timeout
+            )
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        /**
+         * 等待所有已提交的任务完成
+         * @param {Optional[float]} timeout - 最长等待秒数，为空时一直等待
+         * @returns {boolean} 是否全部完成
+         */
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._active == 0 and not any(self._queues.values()),
+                timeout
+            )
+
+    def cancel(self):
+        """
+        /**
+         * 丢弃所有尚未开始的任务
+         */
+        """
+        with self._cond:
+            dropped = [item[2] for queue in self._queues.values() for item in queue]
+            for queue in self._queues.values():
+                queue.clear()
+            self._queued_bytes = 0
+            self._cond.notify_all()
+        for task in dropped:
+            self._finish(task, False)
+
+    def shutdown(self, wait: bool = True):
+        """
+        /**
+         * 关闭调度器
+         * @param {boolean} wait - 是否等待队列中的任务下载完成，否则直接丢弃
+         */
+        """
+        if not wait:
+            self.cancel()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def pending_count(self) -> int:
+        """
+        /**
+         * 获取等待中和下载中的任务数
+         * @returns {int} 任务数
+         */
+        """
+        with self._cond:
+            return sum(len(q) for q in self._queues.values()) + self._active
+
+    def _finish(self, task: DownloadTask, success: bool):
+        if task.callback:
+            try:
+                task.callback(success)
+            except Exception as e:
+                print(f"\n下载回调出错 {task.url}: {str(e)}")
+
+    def _take_next(self) -> Optional[DownloadTask]:
+        # 按已派发字节数从少到多依次尝试各用户的队首任务，取第一个放得下的
+        users = sorted((u for u, q in self._queues.items() if q), key=lambda u: self._served[u])
+        for user in users:
+            task = self._queues[user][0][2]
+            if self._active and self._inflight_bytes + task.cost > self.max_bytes_in_flight:
+                continue
+            heapq.heappop(self._queues[user])
+            self._served[user] += task.cost
+            self._queued_bytes -= task.cost
+            self._inflight_bytes += task.cost
+            self._active += 1
+            self._cond.notify_all()
+            return task
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    task = self._take_next()
+                    if task:
+                        break
+                    if self._closed and not any(self._queues.values()):
+                        return
+                    self._cond.wait()
+            
+            success = False
+            try:
+                success = task.downloader.download_image(
+                    url=task.url,
+                    subject=task.subject,
+                    filename=task.filename
+                )
+            except Exception as e:
+                print(f"\n下载失败 {task.url}: {str(e)}")
+            finally:
+                # 先执行回调再计为完成，保证 join() 返回时回调都已执行
+                self._finish(task, success)
+                with self._cond:
+                    self._inflight_bytes -= task.cost
+                    self._active -= 1
+                    if success:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                    self._cond.notify_all()
+            
+            if self.interval:
+                time.sleep(self.interval)
+
+def _detect_compression(path: str) -> Optional[str]:
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return None
+
+class MetadataSink:
+    """
+    /**
+     * 帖子元数据导出器，以追加方式写入 JSONL（每行一条帖子）
+     * 写入的记录先缓存在内存中，超过 max_buffer_bytes 或调用 flush() 时批量写入文件；
+     * 压缩时每批写成一个完整的 gzip 成员或 zstd 帧，程序异常退出最多丢失最后一批
+     * @param {string} path - 输出文件路径
+     * @param {string} compression - 压缩方式："gzip"、"zstd" 或 None，为空时根据扩展名 .gz/.zst 判断
+     * @param {int} max_buffer_bytes - 内存缓冲区上限字节数
+     * @param {boolean} include_raw - 是否同时保存接口返回的原始帖子数据
+     * @param {Optional[float]} flush_interval - 定时刷新缓冲区的间隔秒数，为空时只在缓冲区满或调用 flush() 时写入
+     */
+    """
+    def __init__(self, path: str, compression: Optional[str] = None,
+                 max_buffer_bytes: int = 1024 * 1024, include_raw: bool = False,
+                 flush_interval: Optional[float] = None):
+        self.path = path
+        self.compression = compression or _detect_compression(path)
+        if self.compression not in (None, "gzip", "zstd"):
+            raise ValueError(f"不支持的压缩方式: {self.compression}")
+        if self.compression == "zstd" and zstandard is None:
+            raise RuntimeError("使用 zstd 压缩需要安装 zstandard: pip install zstandard")
+        self.max_buffer_bytes = max_buffer_bytes
+        self.include_raw = include_raw
+        
+        self._buffer: List[bytes] = []
+        self._buffer_bytes = 0
+        self._lock = threading.Lock()
+        self._compressor = zstandard.ZstdCompressor(write_checksum=True) if self.compression == "zstd" else None
+        
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, 'ab')
+        if self.compression is None and self._file.tell() > 0:
+            # 上次异常退出可能留下不完整的一行，先换行避免和新记录连在一起
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write(b"\n")
+        
+        # 记录由下载回调陆续写入，长时间运行时定时刷新，避免异常退出丢失太多
+        self.flush_interval = flush_interval
+        self._stop_event = threading.Event()
+        if flush_interval:
+            flusher = threading.Thread(target=self._flush_loop)
+            flusher.daemon = True
+            flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def build_record(self, post: Dict, image_paths: Dict[str, str],
+                     downloaded: Optional[Dict[str, bool]] = None) -> Dict:
+        """
+        /**
+         * 从接口返回的帖子数据生成元数据记录
+         * @param {Dict} post - 帖子数据
+         * @param {Dict[str, str]} image_paths - 图片URL到本地路径的映射
+         * @param {Optional[Dict[str, bool]]} downloaded - 图片URL到是否下载成功的映射，为空表示下载结果未知
+         * @returns {Dict} 元数据记录
+         */
+        """
+        info = post.get('post') or {}
+        record = {
+            "post_id": info.get('post_id'),
+            "uid": info.get('uid') or (post.get('user') or {}).get('uid'),
+            "nickname": (post.get('user') or {}).get('nickname'),
+            "subject": info.get('subject'),
+            "content": info.get('content'),
+            "created_at": info.get('created_at'),
+            "updated_at": info.get('updated_at'),
+            "forum": (post.get('forum') or {}).get('name'),
+            "topics": [topic.get('name') for topic in post.get('topics') or []],
+            "stat": post.get('stat'),
+            "images": [
+                {
+                    "url": img.get('url'),
+                    "width": img.get('width'),
+                    "height": img.get('height'),
+                    "format": img.get('format'),
+                    "size": img.get('size'),
+                    "path": image_paths.get(img.get('url')),
+                    "downloaded": downloaded.get(img.get('url'), False) if downloaded is not None else None
+                }
+                for img in post.get('image_list') or []
+            ]
+        }
+        if self.include_raw:
+            record["raw"] = post
+        return record
+
+    def write_post(self, post: Dict, image_paths: Dict[str, str],
+                   downloaded: Optional[Dict[str, bool]] = None):
+        """
+        /**
+         * 写入一条帖子的元数据
+         * @param {Dict} post - 帖子数据
+         * @param {Dict[str, str]} image_paths - 图片URL到本地路径的映射
+         * @param {Optional[Dict[str, bool]]} downloaded - 图片URL到是否下载成功的映射，为空表示下载结果未知
+         */
+        """
+        self.write(self.build_record(post, image_paths, downloaded))
+
+    def write(self, record: Dict):
+        """
+        /**
+         * 写入一条记录，缓冲区满时自动刷新
+         * @param {Dict} record - 可序列化为 JSON 的记录
+         */
+        """
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            if self._file.closed:
+                # 强制退出时仍在下载的图片可能在关闭后才结束，此时丢弃其记录
+                return
+            self._buffer.append(line)
+            self._buffer_bytes += len(line)
+            if self._buffer_bytes >= self.max_buffer_bytes:
+                self._flush_locked()
+
+    def flush(self):
+        """
+        /**
+         * 将缓冲区写入文件，写入的内容立即可被读取
+         */
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        batch = b"".join(self._buffer)
+        self._buffer.clear()
+        self._buffer_bytes = 0
+        if self.compression == "gzip":
+            batch = gzip.compress(batch)
+        elif self.compression == "zstd":
+            batch = self._compressor.compress(batch)
+        self._file.write(batch)
+        self._file.flush()
+
+    def close(self):
+        """
+        /**
+         * 刷新缓冲区并关闭文件
+         */
+        """
+        self._stop_event.set()
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush_locked()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def _iter_compressed_lines(f, magic: bytes, new_decompressor, errors: Tuple) -> Iterator[bytes]:
+    # 逐块解压由多个独立 gzip 成员或 zstd 帧拼接成的文件；
+    # 遇到损坏或不完整的块时丢弃该块中未完成的行，并从下一个块的起始标记处继续
+    data = b""
+    decompressor = None
+    text = b""
+    eof = False
+    skipping = False  # 是否正在跳过已提示过的损坏数据
+    
+    while True:
+        if not eof:
+            chunk = f.read(64 * 1024)
+            eof = not chunk
+            data += chunk
+        
+        while data:
+            if decompressor is None:
+                index = data.find(magic)
+                if index < 0:
+                    # 保留末尾几个字节，起始标记可能跨越两次读取
+                    if eof:
+                        if not skipping:
+                            print(f"\n元数据文件 {f.name} 末尾有 {len(data)} 字节无法识别，已跳过")
+                        data = b""
+                    else:
+                        data = data[-(len(magic) - 1):]
+                    break
+                if index > 0 and not skipping:
+                    print(f"\n元数据文件 {f.name} 中有 {index} 字节损坏，已跳过")
+                skipping = False
+                data = data[index:]
+                decompressor = new_decompressor()
+                text = b""
+            
+            try:
+                text += decompressor.decompress(data)
+            except errors:
+                if not skipping:
+                    print(f"\n元数据文件 {f.name} 中有损坏的数据块，已跳过")
+                skipping = True
+                decompressor = None
+                data = data[1:]
+                continue
+            
+            lines = text.split(b"\n")
+            text = lines.pop()
+            yield from lines
+            
+            if decompressor.eof:
+                data = decompressor.unused_data
+                decompressor = None
+            else:
+                data = b""
+        
+        if eof:
+            if decompressor is not None:
+                print(f"\n元数据文件 {f.name} 末尾的数据块不完整，已跳过")
+            return
+
+def iter_metadata(path: str, compression: Optional[str] = None) -> Iterator[Dict]:
+    """
+    /**
+     * 逐条读取 MetadataSink 导出的元数据，不会一次性加载整个文件
+     * 因程序中断而损坏或不完整的数据块会被跳过并提示，不影响之后的记录
+     * @param {string} path - 元数据文件路径
+     * @param {string} compression - 压缩方式，为空时根据扩展名判断
+     * @returns {Iterator[Dict]} 帖子元数据记录
+     */
+    """
+    compression = compression or _detect_compression(path)
+    
+    with open(path, 'rb') as f:
+        if compression == "gzip":
+            lines = _iter_compressed_lines(
+                f, b"\x1f\x8b\x08", lambda: zlib.decompressobj(16 + zlib.MAX_WBITS), (zlib.error,)
+            )
+        elif compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError("读取 zstd 压缩文件需要安装 zstandard: pip install zstandard")
+            lines = _iter_compressed_lines(
+                f, b"\x28\xb5\x2f\xfd", lambda: zstandard.ZstdDecompressor().decompressobj(),
+                (zstandard.ZstdError,)
+            )
+        else:
+            lines = f
+        
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # 写入中断时可能留下不完整的一行
+                continue
+
+class PostWatcher:
+    """
+    /**
+     * 监视模式：定时轮询多个用户的新帖子并下载图片
+     * 每次轮询只请求第一页，仅当整页都是新帖时才继续翻页；
+     * 轮询间隔根据用户发帖频率自适应调整，所有用户共享连接池、限速器和下载调度器；
+     * 图片未能全部下载成功的帖子记录在状态文件中，之后每次轮询该用户时重试
+     * @param {List[str]} uids - 用户ID列表
+     * @param {string} base_path - 图片保存基础路径
+     * @param {string} state_path - 轮询状态文件路径，为空时保存在 base_path 下
+     * @param {float} min_interval - 单个用户的最短轮询间隔秒数
+     * @param {float} max_interval - 单个用户的最长轮询间隔秒数
+     * @param {int} page_size - 每次轮询第一页的帖子数
+     * @param {boolean} backfill - 首次监视某用户时是否下载其全部历史帖子
+     * @param {float} request_interval - 所有用户共享的接口请求最小间隔秒数
+     * @param {string} metadata_path - 帖子元数据导出文件路径，为空时不导出
+     */
+    """
+    # 帖子最多重试下载的次数，超过后放弃
+    MAX_POST_ATTEMPTS = 5
+
+    def __init__(self, uids: List[str], base_path: str, state_path: Optional[str] = None,
+                 min_interval: float = 300, max_interval: float = 6 * 3600, page_size: int = 5,
+                 backfill: bool = False, request_interval: float = 1.0,
+                 metadata_path: Optional[str] = None):
+        self.uids = list(dict.fromkeys(uids))
+        self.base_path = base_path
+        self.state_path = state_path or os.path.join(base_path, "watch_state.json")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.page_size = page_size
+        self.backfill = backfill
+        
+        self.session = create_session()
+        self.rate_limiter = RateLimiter(request_interval)
+        self.scheduler = DownloadScheduler()
+        self.metadata_sink = MetadataSink(metadata_path, flush_interval=5) if metadata_path else None
+        self.crawlers: Dict[str, MysPostCrawler] = {}
+        self.state: Dict[str, Dict] = self._load_state()
+        # 下载回调在调度器线程中修改 state，读写 state 中的 pending 需持有此锁
+        self._state_lock = threading.Lock()
+        self._inflight = set()  # 正在下载的 (用户ID, 帖子ID)
+
+    def _load_state(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取监视状态失败，将重新开始: {str(e)}")
+            return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with self._state_lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _log(self, message: str):
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+
+    def _get_crawler(self, uid: str) -> MysPostCrawler:
+        if uid not in self.crawlers:
+            self.crawlers[uid] = MysPostCrawler(
+                uid,
+                base_path=self.base_path,
+                scheduler=self.scheduler,
+                session=self.session,
+                rate_limiter=self.rate_limiter,
+                metadata_sink=self.metadata_sink
+            )
+        return self.crawlers[uid]
+
+    def _is_new(self, post: Dict, last_created_at: int, seen: set) -> bool:
+        post_id = str(post['post']['post_id'])
+        created_at = int(post['post'].get('created_at') or 0)
+        return post_id not in seen and created_at >= last_created_at
+
+    def _submit_post(self, uid: str, crawler: MysPostCrawler, post: Dict):
+        # 提交前先记入 pending，直到所有图片下载成功才移除；中途退出后下次启动会重试
+        post_id = str(post['post']['post_id'])
+        with self._state_lock:
+            pending = self.state[uid]["pending"]
+            entry = pending.setdefault(post_id, {"post": post, "attempts": 0})
+            if (uid, post_id) in self._inflight:
+                return
+            entry["attempts"] += 1
+            self._inflight.add((uid, post_id))
+        crawler.process_single_post(post, on_complete=functools.partial(self._on_post_done, uid, post_id))
+
+    def _on_post_done(self, uid: str, post_id: str, success: bool):
+        gave_up = False
+        with self._state_lock:
+            self._inflight.discard((uid, post_id))
+            pending = self.state[uid]["pending"]
+            entry = pending.get(post_id)
+            if entry and (success or entry["attempts"] >= self.MAX_POST_ATTEMPTS):
+                del pending[post_id]
+                gave_up = not success
+        if gave_up:
+            self._log(f"用户 {uid} 的帖子 {post_id} 多次下载失败，已放弃")
+
+    def poll_user(self, uid: str) -> int:
+        """
+        /**
+         * 轮询单个用户：先重试之前未下载成功的帖子，再逐页提交新帖子的图片下载
+         * @param {string} uid - 用户ID
+         * @returns {int} 新帖子数
+         */
+        """
+        crawler = self._get_crawler(uid)
+        with self._state_lock:
+            state = self.state.setdefault(uid, {"interval": self.min_interval})
+            first_poll = "last_created_at" not in state
+            state.setdefault("last_created_at", 0)
+            state.setdefault("seen", [])
+            state.setdefault("pending", {})
+            retry_posts = [entry["post"] for entry in state["pending"].values()]
+        baseline = first_poll and not self.backfill
+        
+        for post in retry_posts:
+            self._submit_post(uid, crawler, post)
+        
+        # 翻页过程中按轮询开始时的进度判断新帖，全部翻完后再更新
+        last_created_at = state["last_created_at"]
+        seen = set(state["seen"])
+        new_posts = []
+        offset = ""
+        size = self.page_size
+        while True:
+            data = crawler.fetch_page(offset, size=size)
+            if not data or "data" not in data:
+                raise RuntimeError("获取帖子列表失败")
+            
+            posts = data["data"]["list"]
+            page_new = [post for post in posts if self._is_new(post, last_created_at, seen)]
+            new_posts.extend(page_new)
+            if not baseline:
+                # 每页的新帖立即提交下载，不等翻完全部页
+                for post in page_new:
+                    self._submit_post(uid, crawler, post)
+            
+            # 帖子按时间倒序排列，本页最后一条已不是新帖说明后面都已处理过
+            if baseline:
+                break
+            if not posts or not self._is_new(posts[-1], last_created_at, seen) or data["data"]["is_last"]:
+                break
+            offset = data["data"]["next_offset"]
+            size = 20
+            # 待下载的图片积压过多时暂停翻页
+            self.scheduler.wait_for_capacity()
+        
+        if baseline:
+            self._log(f"开始监视 {crawler.username}({uid})，仅下载此后发布的新帖子")
+        
+        # 只需记住发布时间等于 last_created_at 的帖子ID，更早的帖子由时间判断
+        if new_posts:
+            newest = max(int(post['post'].get('created_at') or 0) for post in new_posts)
+            if newest > state["last_created_at"]:
+                state["last_created_at"] = newest
+                state["seen"] = []
+            state["seen"].extend(
+                str(post['post']['post_id']) for post in new_posts
+                if int(post['post'].get('created_at') or 0) == newest
+            )
+        
+        return 0 if baseline else len(new_posts)
+
+    def _schedule_next(self, uid: str, new_count: int, failed: bool = False) -> float:
+        state = self.state.setdefault(uid, {"interval": self.min_interval})
+        interval = state.get("interval", self.min_interval)
+        if failed:
+            interval *= 2
+        elif new_count:
+            # 有新帖说明用户较活跃，缩短间隔
+            interval /= 2
+        else:
+            interval *= 1.5
+        interval = min(self.max_interval, max(self.min_interval, interval))
+        state["interval"] = interval
+        # 加入随机抖动，避免多个用户的请求集中在同一时刻
+        state["next_poll"] = time.time() + interval * random.uniform(0.9, 1.1)
+        return state["next_poll"]
+
+    def run(self):
+        """
+        /**
+         * 持续运行监视循环，按 Ctrl+C 退出
+         */
+        """
+        # 按下次轮询时间排序的最小堆
+        heap = [(self.state.get(uid, {}).get("next_poll", 0), uid) for uid in self.uids]
+        heapq.heapify(heap)
+        self._log(f"监视模式已启动，共 {len(self.uids)} 个用户")
+        
+        try:
+            while heap:
+                next_poll, uid = heapq.heappop(heap)
+                delay = next_poll - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                # 待下载的图片积压过多时先不发现新帖子
+                self.scheduler.wait_for_capacity()
+                
+                try:
+                    new_count = self.poll_user(uid)
+                    next_poll = self._schedule_next(uid, new_count)
+                    if new_count:
+                        self._log(f"{self.crawlers[uid].username}({uid}) 有 {new_count} 条新帖子 | 待下载 {self.scheduler.pending_count()} 张图片")
+                except Exception as e:
+                    next_poll = self._schedule_next(uid, 0, failed=True)
+                    self._log(f"轮询用户 {uid} 失败: {str(e)}")
+                
+                if self.metadata_sink:
+                    self.metadata_sink.flush()
+                self._save_state()
+                heapq.heappush(heap, (next_poll, uid))
+                
+        except KeyboardInterrupt:
+            self._log("正在等待剩余图片下载完成，再次按 Ctrl+C 强制退出...")
+            try:
+                self.scheduler.shutdown(wait=True)
+            except KeyboardInterrupt:
+                pass
+            if self.metadata_sink:
+                self.metadata_sink.close()
+            self._save_state()
+            self._log("监视已停止")
+
+class WorkQueue:
+    """
+    /**
+     * 基于 SQLite 的持久化任务队列，可被多个进程或多台机器（共享存储）同时使用
+     * 任务以租约方式领取：租约到期未完成的任务会被其他工作进程重新领取；
+     * 相同 key 的任务只会入队一次
+     * 注意：多台机器共享时各机器时钟需同步，共享存储需支持文件锁，且需关闭 WAL（wal=False）
+     * @param {string} path - 队列数据库文件路径
+     * @param {float} lease_seconds - 租约时长秒数
+     * @param {int} max_attempts - 单个任务最多尝试次数，超过后标记为失败
+     * @param {boolean} wal - 新建数据库时是否使用 WAL 日志模式，读取进度时不阻塞领取任务，仅适用于同一台机器上的进程；
+     *                        日志模式保存在数据库文件中，打开已有数据库时沿用原模式
+     */
+    """
+    # 数值越小越先被领取：先下载已发现的图片，再去发现新的帖子
+    PRIORITIES = {"image": 0, "user": 1}
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3, wal: bool = True):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 手动管理事务，领取任务时用 BEGIN IMMEDIATE 保证同一任务不会被重复领取
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        # 日志模式只在新建时设置：切换已有数据库会影响正在使用它的其他进程和机器
+        # （WAL 依赖共享内存，不能用于网络文件系统上的多机共享）
+        created = self.conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'jobs'"
+        ).fetchone()[0]
+        if not created:
+            self.conn.execute(f"PRAGMA journal_mode = {'WAL' if wal else 'DELETE'}")
+        else:
+            journal_mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+            if (journal_mode == "wal") != wal:
+                print(f"提示：队列数据库 {path} 使用 {journal_mode.upper()} 日志模式，"
+                      f"与{'默认的 WAL' if wal else ' --no-wal'} 设置不一致，将沿用原模式")
+        with self._transaction():
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    owner TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    bytes INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated_at REAL
+                )
+            """)
+            # 领取待处理任务时按 (priority, id) 顺序直接扫描索引，无需排序
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, priority, id)"
+            )
+            # 查找租约过期的任务和统计活跃工作进程
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (state, lease_expires)"
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def put(self, kind: str, key: str, payload: Dict) -> bool:
+        """
+        /**
+         * 添加任务，key 已存在时忽略
+         * @param {string} kind - 任务类型："user" 或 "image"
+         * @param {string} key - 去重键
+         * @param {Dict} payload - 任务参数
+         * @returns {boolean} 是否为新任务
+         */
+        """
+        return self.put_many([(kind, key, payload)]) == 1
+
+    def put_many(self, jobs: List[Tuple[str, str, Dict]], requeue_finished: bool = False) -> int:
+        """
+        /**
+         * 在同一事务中批量添加任务，key 已存在的任务被忽略
+         * @param {List[Tuple]} jobs - (任务类型, 去重键, 任务参数) 列表
+         * @param {boolean} requeue_finished - 是否把已完成或已失败的同 key 任务重新放回队列
+         * @returns {int} 新增或重新入队的任务数
+         */
+        """
+        now = time.time()
+        if requeue_finished:
+            sql = ("INSERT INTO jobs (kind, key, payload, priority, updated_at) VALUES (?, ?, ?, ?, ?) "
+                   "ON CONFLICT (key) DO UPDATE SET payload = excluded.payload, state = 'pending', "
+                   "attempts = 0, error = NULL, updated_at = excluded.updated_at "
+                   "WHERE state IN ('done', 'failed')")
+        else:
+            sql = "INSERT OR IGNORE INTO jobs (kind, key, payload, priority, updated_at) VALUES (?, ?, ?, ?, ?)"
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                sql,
+                [(kind, key, json.dumps(payload, ensure_ascii=False), self.PRIORITIES[kind], now)
+                 for kind, key, payload in jobs]
+            )
+            return self.conn.total_changes - before
+
+    def claim(self, owner: str, limit: int = 1) -> List[Dict]:
+        """
+        /**
+         * 领取待处理或租约已过期的任务
+         * @param {string} owner - 工作进程标识
+         * @param {int} limit - 最多领取的任务数
+         * @returns {List[Dict]} 任务列表，包含 id、kind、key、payload
+         */
+        """
+        now = time.time()
+        with self._transaction():
+            # 多次租约过期仍未完成的任务不再重试
+            self.conn.execute(
+                "UPDATE jobs SET state = 'failed', owner = NULL, error = '租约多次过期', updated_at = ? "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            # 租约过期的任务优先重新领取，其余名额从待处理任务中按优先级领取；
+            # 两个查询分别走 jobs_lease 和 jobs_claim 索引，不会在持有写锁时排序整个队列
+            rows = self.conn.execute(
+                "SELECT id, kind, key, payload FROM jobs "
+                "WHERE state = 'leased' AND lease_expires < ? LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if len(rows) < limit:
+                rows += self.conn.execute(
+                    "SELECT id, kind, key, payload FROM jobs "
+                    "WHERE state = 'pending' ORDER BY priority, id LIMIT ?",
+                    (limit - len(rows),)
+                ).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET state = 'leased', owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [(owner, now + self.lease_seconds, now, row["id"]) for row in rows]
+            )
+        return [
+            {"id": row["id"], "kind": row["kind"], "key": row["key"], "payload": json.loads(row["payload"])}
+            for row in rows
+        ]
+
+    def renew(self, job_id: int, owner: str, payload: Optional[Dict] = None) -> bool:
+        """
+        /**
+         * 续租任务，可同时保存任务进度
+         * @param {int} job_id - 任务ID
+         * @param {string} owner - 工作进程标识
+         * @param {Optional[Dict]} payload - 新的任务参数，为空时不修改
+         * @returns {boolean} 是否仍持有该任务的租约
+         */
+        """
+        now = time.time()
+        with self._transaction():
+            if payload is None:
+                cursor = self.conn.execute(
+                    "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                    "WHERE id = ? AND owner = ? AND state = 'leased'",
+                    (now + self.lease_seconds, now, job_id, owner)
+                )
+            else:
+                cursor = self.conn.execute(
+                    "UPDATE jobs SET lease_expires = ?, updated_at = ?, payload = ? "
+                    "WHERE id = ? AND owner = ? AND state = 'leased'",
+                    (now + self.lease_seconds, now, json.dumps(payload, ensure_ascii=False), job_id, owner)
+                )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, owner: str, bytes_size: int = 0) -> bool:
+        """
+        /**
+         * 标记任务完成
+         * @param {int} job_id - 任务ID
+         * @param {string} owner - 工作进程标识
+         * @param {int} bytes_size - 任务产生的字节数，用于统计
+         * @returns {boolean} 是否成功（租约已被他人领取时返回 False）
+         */
+        """
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET state = 'done', owner = NULL, lease_expires = NULL, bytes = ?, "
+                "error = NULL, updated_at = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                (bytes_size, time.time(), job_id, owner)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, owner: str, error: str):
+        """
+        /**
+         * 标记任务失败，未超过最大尝试次数时放回队列
+         * @param {int} job_id - 任务ID
+         * @param {string} owner - 工作进程标识
+         * @param {string} error - 错误信息
+         */
+        """
+        with self._transaction():
+            self.conn.execute(
+                "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (self.max_attempts, error, time.time(), job_id, owner)
+            )
+
+    def unfinished_count(self) -> int:
+        """
+        /**
+         * 获取尚未完成（待处理或处理中）的任务数
+         * @returns {int} 任务数
+         */
+        """
+        row = self.conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'leased')"
+        ).fetchone()
+        return row[0]
+
+    def stats(self) -> Dict:
+        """
+        /**
+         * 汇总所有工作进程的进度
+         * @returns {Dict} 各任务类型各状态的任务数和字节数，以及当前活跃的工作进程数
+         */
+        """
+        result: Dict = {"jobs": {}, "workers": 0}
+        for row in self.conn.execute(
+            "SELECT kind, state, COUNT(*) AS count, SUM(bytes) AS bytes FROM jobs GROUP BY kind, state"
+        ):
+            result["jobs"].setdefault(row["kind"], {})[row["state"]] = {
+                "count": row["count"],
+                "bytes": row["bytes"] or 0
+            }
+        result["workers"] = self.active_workers()
+        return result
+
+    def active_workers(self) -> int:
+        """
+        /**
+         * 获取当前持有有效租约的工作进程数
+         * @returns {int} 工作进程数
+         */
+        """
+        row = self.conn.execute(
+            "SELECT COUNT(DISTINCT owner) FROM jobs WHERE state = 'leased' AND lease_expires >= ?",
+            (time.time(),)
+        ).fetchone()
+        return row[0]
+
+    def close(self):
+        self.conn.close()
+
+class QueueWorker:
+    """
+    /**
+     * 任务队列的工作进程
+     * user 任务：翻页获取用户帖子，把图片作为 image 任务放回队列；
+     * image 任务：下载单张图片
+     * @param {string} queue_path - 队列数据库文件路径
+     * @param {string} worker_id - 工作进程标识，为空时使用 主机名-进程号
+     * @param {float} lease_seconds - 租约时长秒数
+     * @param {int} batch_size - 每次领取的任务数
+     * @param {float} request_interval - 所有工作进程合计的接口请求最小间隔秒数，
+     *                                     每个进程按当前活跃的工作进程数放大自己的间隔
+     * @param {string} metadata_path - 帖子元数据导出文件路径，实际写入加上工作进程标识的单独文件，为空时不导出
+     * @param {boolean} wal - 队列数据库是否使用 WAL 日志模式，多台机器共享时需关闭
+     */
+    """
+    def __init__(self, queue_path: str, worker_id: Optional[str] = None, lease_seconds: float = 300,
+                 batch_size: int = 4, request_interval: float = 1.0, metadata_path: Optional[str] = None,
+                 wal: bool = True):
+        self.queue = WorkQueue(queue_path, lease_seconds=lease_seconds, wal=wal)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.session = create_session()
+        self.request_interval = request_interval
+        self.rate_limiter = RateLimiter(request_interval)
+        self.downloaders: Dict[str, ImageDownloader] = {}
+        self.metadata_sink = None
+        if metadata_path:
+            self.metadata_sink = MetadataSink(self.get_metadata_path(metadata_path, self.worker_id))
+
+    @staticmethod
+    def get_metadata_path(metadata_path: str, worker_id: str) -> str:
+        """
+        /**
+         * 获取工作进程单独的元数据文件路径，如 meta.jsonl.gz -> meta.主机名-进程号.jsonl.gz
+         * @param {string} metadata_path - 指定的元数据文件路径
+         * @param {string} worker_id - 工作进程标识
+         * @returns {string} 该工作进程的元数据文件路径
+         */
+        """
+        root, ext = os.path.splitext(metadata_path)
+        if ext in (".gz", ".zst"):
+            root, inner_ext = os.path.splitext(root)
+            ext = inner_ext + ext
+        return f"{root}.{worker_id}{ext}"
+
+    def _log(self, message: str):
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] [{self.worker_id}] {message}")
+
+    def _get_downloader(self, save_path: str) -> ImageDownloader:
+        if save_path not in self.downloaders:
+            self.downloaders[save_path] = ImageDownloader(base_path=save_path, session=self.session)
+        return self.downloaders[save_path]
+
+    def _update_rate_limit(self):
+        # 各进程各自限速，按活跃进程数放大间隔，使整个集群的接口请求频率保持不变
+        self.rate_limiter.min_interval = self.request_interval * max(1, self.queue.active_workers())
+
+    def _run_user_job(self, job: Dict) -> int:
+        payload = job["payload"]
+        self._update_rate_limit()
+        crawler = MysPostCrawler(
+            payload["uid"],
+            base_path=payload["base_path"],
+            session=self.session,
+            rate_limiter=self.rate_limiter
+        )
+        # 从上次租约中断的位置继续翻页
+        offset = payload.get("offset", "")
+        total_count = 0
+        
+        while True:
+            data = crawler.fetch_page(offset)
+            if not data or "data" not in data:
+                raise RuntimeError("获取帖子列表失败")
+            
+            images = []
+            for post in data["data"]["list"]:
+                subject = post['post']['subject']
+                image_paths = {}
+                for url, filename, size in crawler.iter_post_images(post):
+                    image_paths[url] = crawler.downloader.get_image_path(subject, filename)
+                    images.append(("image", f"{payload['uid']}/{filename}", {
+                        "url": url,
+                        "save_path": crawler.save_path,
+                        "subject": subject,
+                        "filename": filename,
+                        "size": size
+                    }))
+                # 图片由之后的 image 任务下载，记录中的 downloaded 为 None（未知）
+                if self.metadata_sink:
+                    self.metadata_sink.write_post(post, image_paths)
+            total_count += self.queue.put_many(images) if images else 0
+            # 先写出本页元数据再保存翻页进度，中断后重做本页最多产生重复记录
+            if self.metadata_sink:
+                self.metadata_sink.flush()
+            
+            if data["data"]["is_last"]:
+                break
+            offset = data["data"]["next_offset"]
+            if not self.queue.renew(job["id"], self.worker_id, dict(payload, offset=offset)):
+                raise RuntimeError("租约已失效")
+            self._update_rate_limit()
+        
+        self._log(f"{crawler.username}({payload['uid']}) 新增 {total_count} 个图片任务")
+        return 0
+
+    def _run_image_job(self, job: Dict) -> int:
+        payload = job["payload"]
+        downloader = self._get_downloader(payload["save_path"])
+        if not downloader.download_image(
+            url=payload["url"],
+            subject=payload["subject"],
+            filename=payload["filename"]
+        ):
+            raise RuntimeError(f"下载失败 {payload['url']}")
+        return os.path.getsize(downloader.get_image_path(payload["subject"], payload["filename"]))
+
+    def run(self, exit_when_idle: bool = True, idle_interval: float = 5):
+        """
+        /**
+         * 循环领取并处理任务
+         * @param {boolean} exit_when_idle - 队列中没有未完成的任务时是否退出
+         * @param {float} idle_interval - 暂无可领取任务时的等待秒数
+         */
+        """
+        self._log("工作进程已启动")
+        done_count = 0
+        
+        try:
+            while True:
+                jobs = self.queue.claim(self.worker_id, limit=self.batch_size)
+                if not jobs:
+                    # 其他进程仍在处理的 user 任务可能还会产生新的图片任务
+                    if exit_when_idle and self.queue.unfinished_count() == 0:
+                        break
+                    time.sleep(idle_interval)
+                    continue
+                
+                for job in jobs:
+                    # 批量领取的任务在开始前续租，租约已被他人领取的跳过
+                    if not self.queue.renew(job["id"], self.worker_id):
+                        continue
+                    try:
+                        if job["kind"] == "user":
+                            bytes_size = self._run_user_job(job)
+                        else:
+                            bytes_size = self._run_image_job(job)
+                    except Exception as e:
+                        self.queue.fail(job["id"], self.worker_id, str(e))
+                        self._log(f"任务 {job['key']} 失败: {str(e)}")
+                        continue
+                    
+                    if self.queue.complete(job["id"], self.worker_id, bytes_size):
+                        done_count += 1
+                        if done_count % 50 == 0:
+                            self._log(f"已完成 {done_count} 个任务")
+                    
+                    if job["kind"] == "image":
+                        time.sleep(0.5)
+                        
+        except KeyboardInterrupt:
+            # 未完成的任务在租约到期后会被其他工作进程重新领取
+            pass
+        finally:
+            if self.metadata_sink:
+                self.metadata_sink.close()
+            self.queue.close()
+            
+        self._log(f"工作进程退出，共完成 {done_count} 个任务")
+
+def run_queue_worker(queue_path: str, lease_seconds: float = 300, metadata_path: Optional[str] = None,
+                     wal: bool = True):
+    """
+    /**
+     * 工作进程入口，供 multiprocessing 启动
+     * @param {string} queue_path - 队列数据库文件路径
+     * @param {float} lease_seconds - 租约时长秒数
+     * @param {string} metadata_path - 帖子元数据导出文件路径，为空时不导出
+     * @param {boolean} wal - 队列数据库是否使用 WAL 日志模式
+     */
+    """
+    QueueWorker(queue_path, lease_seconds=lease_seconds, metadata_path=metadata_path, wal=wal).run()
+
+def print_queue_status(queue: WorkQueue):
+    """
+    /**
+     * 打印任务队列的汇总进度
+     * @param {WorkQueue} queue - 任务队列
+     */
+    """
+    stats = queue.stats()
+    names = {"user": "用户", "image": "图片"}
+    for kind in ("user", "image"):
+        states = stats["jobs"].get(kind, {})
+        counts = {state: states.get(state, {}).get("count", 0) for state in ("pending", "leased", "done", "failed")}
+        line = (f"{names[kind]}任务：待处理 {counts['pending']} | 处理中 {counts['leased']} | "
+                f"已完成 {counts['done']} | 失败 {counts['failed']}")
+        if kind == "image":
+            total_bytes = states.get("done", {}).get("bytes", 0)
+            line += f" | 已下载 {total_bytes / (1024 * 1024):.1f}MB"
+        print(line)
+    print(f"活跃工作进程：{stats['workers']}")
+
 class MysUI:
-    def __init__(self):
+    def __init__(self, metadata_path: Optional[str] = None):
         self.root = tk.Tk()
         self.root.title("米游社帖子下载器")
         self.root.geometry("600x300")
@@ -388,6 +1777,8 @@ class MysUI:
         self.status_var = tk.StringVar(value="等待开始...")
         self.is_running = False
         self.crawler = None
+        self.scheduler = None
+        self.metadata_path = metadata_path  # 为空时不导出帖子元数据
         
         # 添加用户ID输入变更追踪
         self.uid_var.trace_add("write", self.on_uid_change)
@@ -603,14 +1994,29 @@ class MysUI:
         # 创建基础路径（日期目录）
         date_path = os.path.join(os.getcwd(), self.base_dir, self.today)
         
+        self.scheduler = DownloadScheduler()
+        metadata_sink = None
         try:
+            if self.metadata_path:
+                metadata_sink = MetadataSink(self.metadata_path, flush_interval=5)
             # 创建爬虫实例（会验证用户ID）
-            self.crawler = MysPostCrawler(uid, base_path=date_path)
+            self.crawler = MysPostCrawler(
+                uid,
+                base_path=date_path,
+                scheduler=self.scheduler,
+                metadata_sink=metadata_sink
+            )
         except ValueError as e:
+            self.scheduler.shutdown(wait=False)
+            if metadata_sink:
+                metadata_sink.close()
             self.status_var.set(f"错误：{str(e)}，请检查用户ID是否正确")
             messagebox.showerror("错误", "用户ID无效，请检查是否输入正确")
             return
         except Exception as e:
+            self.scheduler.shutdown(wait=False)
+            if metadata_sink:
+                metadata_sink.close()
             self.status_var.set(f"错误：{str(e)}")
             messagebox.showerror("错误", f"发生错误：{str(e)}")
             return
@@ -630,19 +2036,28 @@ class MysUI:
     def stop_download(self):
         """终止下载"""
         self.is_running = False
+        if self.scheduler:
+            self.scheduler.cancel()
         self.status_var.set("欢迎再次使用~")
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
         
     def download_task(self):
         """下载任务"""
+        # 终止后立即重新开始时，新任务会替换 self.crawler/self.scheduler，本线程只使用自己的实例
+        crawler = self.crawler
+        scheduler = self.scheduler
+        
+        def running() -> bool:
+            return self.is_running and self.scheduler is scheduler
+        
         try:
             total_count = 0
             downloaded_count = 0
             offset = ""
             
-            while self.is_running:
-                data = self.crawler.fetch_page(offset)
+            while running():
+                data = crawler.fetch_page(offset)
                 if not data or "data" not in data:
                     if "message" in data:
                         error_msg = f"获取数据失败：{data['message']}"
@@ -657,27 +2072,36 @@ class MysUI:
                 self.update_status(f"已找到 {total_count} 条帖子 | 等待开始下载...")
                 
                 for post in current_posts:
-                    if not self.is_running:
+                    if not running():
                         return
                         
                     subject = post['post']['subject']
                     display_subject = subject[:30] + '...' if len(subject) > 30 else subject
                     
-                    self.crawler.process_single_post(post)
+                    crawler.process_single_post(post)
                     downloaded_count += 1
                     
-                    current_size = self.crawler.downloader.get_size_str()
-                    status = f"已找到 {total_count} 条帖子 | 正在下载第 {downloaded_count}/{total_count} 条帖子，标题为「{display_subject}」| 已下载 {current_size}"
+                    current_size = crawler.downloader.get_size_str()
+                    pending = scheduler.pending_count()
+                    status = f"已找到 {total_count} 条帖子 | 正在处理第 {downloaded_count}/{total_count} 条帖子，标题为「{display_subject}」| 待下载 {pending} 张 | 已下载 {current_size}"
                     self.update_status(status)
                 
                 if data["data"]["is_last"]:
                     break
                     
                 offset = data["data"]["next_offset"]
+                
+                # 待下载的图片积压过多时暂停翻页
+                while running() and not scheduler.wait_for_capacity(timeout=0.5):
+                    self.update_download_status(crawler, scheduler, total_count)
                 time.sleep(1)
             
-            if self.is_running:  # 如果不是手动终止的
-                final_size = self.crawler.downloader.get_size_str()
+            # 等待剩余图片下载完成
+            while running() and not scheduler.join(timeout=0.5):
+                self.update_download_status(crawler, scheduler, total_count)
+            
+            if running():  # 如果不是手动终止的
+                final_size = crawler.downloader.get_size_str()
                 self.update_status(f"下载完成！共处理 {total_count} 条帖子，总大小 {final_size}")
                 
         except Exception as e:
@@ -685,16 +2109,29 @@ class MysUI:
             self.status_var.set(error_msg)
             messagebox.showerror("错误", error_msg)
         finally:
-            if not self.is_running:
-                self.status_var.set("欢迎再次使用~")
-            self.start_btn.config(state=tk.NORMAL)
-            self.stop_btn.config(state=tk.DISABLED)
-            self.is_running = False
+            scheduler.cancel()
+            # 已开始新的下载时不再改动界面状态
+            if self.scheduler is scheduler:
+                if not self.is_running:
+                    self.status_var.set("欢迎再次使用~")
+                self.start_btn.config(state=tk.NORMAL)
+                self.stop_btn.config(state=tk.DISABLED)
+                self.is_running = False
+            # 等正在下载的图片结束、元数据写完后再关闭导出文件
+            scheduler.shutdown(wait=True)
+            if crawler.metadata_sink:
+                crawler.metadata_sink.close()
             
     def update_status(self, text: str):
         """更新状态显示"""
         self.status_var.set(text)
         
+    def update_download_status(self, crawler: MysPostCrawler, scheduler: DownloadScheduler, total_count: int):
+        """更新等待图片下载时的状态显示"""
+        current_size = crawler.downloader.get_size_str()
+        pending = scheduler.pending_count()
+        self.update_status(f"已找到 {total_count} 条帖子 | 待下载 {pending} 张图片 | 已下载 {current_size}")
+        
     def open_images_folder(self):
         """打开图片保存目录"""
         if not os.path.exists(self.images_path):
@@ -719,7 +2156,81 @@ class MysUI:
 
 def main():
     """主函数"""
-    ui = MysUI()
+    parser = argparse.ArgumentParser(description="米游社帖子图片下载器")
+    parser.add_argument("--watch", nargs="+", metavar="UID",
+                        help="以监视模式运行，定时检查这些用户的新帖子（不启动图形界面）")
+    parser.add_argument("--output", default=os.path.join(os.getcwd(), "米游社帖子图片下载器"),
+                        help="图片保存目录")
+    parser.add_argument("--min-interval", type=float, default=300,
+                        help="单个用户的最短轮询间隔秒数")
+    parser.add_argument("--max-interval", type=float, default=6 * 3600,
+                        help="单个用户的最长轮询间隔秒数")
+    parser.add_argument("--backfill", action="store_true",
+                        help="首次监视某用户时下载其全部历史帖子")
+    parser.add_argument("--metadata", metavar="PATH",
+                        help="将帖子元数据追加写入该 JSONL 文件，扩展名为 .gz/.zst 时自动压缩；"
+                             "任务队列模式下每个工作进程写入单独的文件")
+    parser.add_argument("--queue", metavar="PATH",
+                        help="任务队列数据库文件，多个进程或机器可通过共享存储使用同一队列")
+    parser.add_argument("--enqueue", nargs="+", metavar="UID",
+                        help="将这些用户加入任务队列（需配合 --queue）")
+    parser.add_argument("--worker", action="store_true",
+                        help="作为工作进程处理任务队列（需配合 --queue）")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="本机启动的工作进程数")
+    parser.add_argument("--lease", type=float, default=300,
+                        help="任务租约时长秒数，工作进程中断后其任务在租约到期后被重新领取")
+    parser.add_argument("--status", action="store_true",
+                        help="打印任务队列的汇总进度（需配合 --queue）")
+    parser.add_argument("--no-wal", action="store_true",
+                        help="队列数据库不使用 WAL 模式，多台机器通过共享存储使用同一队列时必须加上")
+    args = parser.parse_args()
+    
+    if args.queue:
+        if args.enqueue:
+            queue = WorkQueue(args.queue, wal=not args.no_wal)
+            added = queue.put_many([
+                ("user", f"user:{uid}", {"uid": uid, "base_path": args.output})
+                for uid in args.enqueue
+            ], requeue_finished=True)
+            queue.close()
+            print(f"已加入 {added} 个用户任务")
+        if args.worker:
+            if args.processes > 1:
+                workers = [
+                    multiprocessing.Process(target=run_queue_worker,
+                                            args=(args.queue, args.lease, args.metadata, not args.no_wal))
+                    for _ in range(args.processes)
+                ]
+                for worker in workers:
+                    worker.start()
+                try:
+                    for worker in workers:
+                        worker.join()
+                except KeyboardInterrupt:
+                    for worker in workers:
+                        worker.join()
+            else:
+                run_queue_worker(args.queue, args.lease, args.metadata, not args.no_wal)
+        if args.status or not (args.enqueue or args.worker):
+            queue = WorkQueue(args.queue, wal=not args.no_wal)
+            print_queue_status(queue)
+            queue.close()
+        return
+    
+    if args.watch:
+        watcher = PostWatcher(
+            args.watch,
+            base_path=args.output,
+            min_interval=args.min_interval,
+            max_interval=args.max_interval,
+            backfill=args.backfill,
+            metadata_path=args.metadata
+        )
+        watcher.run()
+        return
+    
+    ui = MysUI(metadata_path=args.metadata)
     ui.run()
 
 if __name__ == "__main__":